@@ -1,3 +1,4 @@
+import gzip
 import json
 import os
 import boto3
@@ -154,6 +155,8 @@ def load_orders_from_s3(execution_name: Optional[str] = None) -> List[Dict[str,
         # Cargar archivo
         file_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
         content = file_response['Body'].read()
+        if file_response.get('ContentEncoding') == 'gzip':
+            content = gzip.decompress(content)
         data = json.loads(content)
         
         return data.get('orders', [])
@@ -1,17 +1,57 @@
-import json
+import gzip
+import io
 import time
+import zlib
 import boto3
 import os
 import orjson
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Any, List
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from operator import itemgetter
+from typing import Dict, Any, Iterator, List, Tuple
+
+# Concurrent S3 downloads; the client's connection pool is sized to match
+MAX_DOWNLOAD_WORKERS = 64
+
+# Created on first use by get_download_executor()
+download_executor = None
+
+# Batch deletes run on their own small pool: downloads are all queued while listing,
+# so sharing the download executor would hold every delete until the last download starts
+MAX_CLEANUP_WORKERS = 2
+cleanup_executor = None
+
+# Opt-in S3 Transfer Acceleration (the bucket must have acceleration enabled)
+S3_ACCELERATE = os.environ.get('S3_ACCELERATE', '').lower() in ('1', 'true')
+
+# Shared S3 client: built once per container and reused by every worker thread
+s3_client = boto3.client(
+    's3',
+    config=Config(
+        max_pool_connections=MAX_DOWNLOAD_WORKERS + MAX_CLEANUP_WORKERS,
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        tcp_keepalive=True,
+        s3={'use_accelerate_endpoint': S3_ACCELERATE}
+    )
+)
+
+# S3 delete_objects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Final result is uploaded in multipart chunks of this size while it is being encoded
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=UPLOAD_CHUNK_SIZE,
+    multipart_chunksize=UPLOAD_CHUNK_SIZE
+)
 
 def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
     """
     Result Collector Lambda: Collects and sorts orders from S3
     """
     try:
-        print(f"📥 Result Collector started with event: {json.dumps(event, default=str)}")
+        print(f"📥 Result Collector started with event keys: {list(event)}")
         # Collect all orders from S3 symbol_results folder
         combined_result = collect_results_from_s3()
         
@@ -29,6 +69,15 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
             'total_orders': len(combined_result.get('orders', []))
         }
         
+        # Files that could not be read are left in symbol_results/ and their orders are
+        # missing from this result: report it as partial instead of a clean success
+        failed_files = combined_result.get('failed_files', [])
+        if failed_files:
+            print(f"⚠️ PARTIAL RESULT: {len(failed_files)} symbol files could not be read: {failed_files}")
+            response_data['message'] = f'Orders processed with {len(failed_files)} unreadable symbol files (partial result)'
+            response_data['failed_file_count'] = len(failed_files)
+            response_data['failed_files'] = failed_files
+        
         # Add S3 result info if available
         if s3_result:
             if isinstance(s3_result, dict):
@@ -37,26 +86,25 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
                 response_data['s3_key'] = s3_result
         
         return {
-            'statusCode': 200,
-            'body': json.dumps(response_data)
+            'statusCode': 206 if failed_files else 200,
+            'body': orjson.dumps(response_data).decode()
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'error': str(e),
                 'message': 'Error in result collector lambda'
-            })
+            }).decode()
         }
 
 
 def store_result_in_s3(all_orders: List[Dict[str, Any]], execution_name: str = None) -> str:
     """
-    Store sorted orders in S3 and return the S3 key with presigned URL
+    Store sorted orders in S3 and return the S3 key with its public URL
     """
     try:
-        s3_client = boto3.client('s3')
         bucket_name = os.environ.get('RESULTS_BUCKET')
         
         if not bucket_name:
@@ -72,14 +120,6 @@ def store_result_in_s3(all_orders: List[Dict[str, Any]], execution_name: str = N
         print(f"📋 Storing {len(all_orders)} orders")
         print(f"🔑 S3 key will be: {s3_key}")
         
-        # Test bucket access first
-        try:
-            s3_client.head_bucket(Bucket=bucket_name)
-            print(f"✅ Bucket {bucket_name} is accessible")
-        except Exception as e:
-            print(f"❌ Cannot access bucket {bucket_name}: {e}")
-            return None
-        
         # Always create a result file (even if empty) for debugging
         if len(all_orders) == 0:
             print("⚠️ No orders found, creating test file for debugging")
@@ -95,29 +135,26 @@ def store_result_in_s3(all_orders: List[Dict[str, Any]], execution_name: str = N
             test_orders = all_orders
             print(f"✅ Using {len(all_orders)} real orders for S3 upload")
         
-        # Prepare CLEAN JSON with only sorted orders (ultra-fast binary encoding)
-        clean_result = {
-            'orders': test_orders
-        }
-        
-        # Use orjson for ultra-fast JSON encoding
-        json_body = orjson.dumps(clean_result, option=orjson.OPT_INDENT_2)
+        # Stream CLEAN JSON with only sorted orders: encoded with orjson and gzipped
+        # chunk by chunk while S3 multipart uploads it, so the full body never sits in memory
+        json_body = IterStream(iter_gzip_json_orders(test_orders))
         
         # Upload to S3 with public read permissions
         print(f"📤 Starting S3 upload to: s3://{bucket_name}/{s3_key}")
-        print(f"📦 JSON body size: {len(json_body)} bytes")
         
         try:
-            put_response = s3_client.put_object(
-                Bucket=bucket_name,
-                Key=s3_key,
-                Body=json_body,
-                ContentType='application/json',
-                ServerSideEncryption='AES256'
+            s3_client.upload_fileobj(
+                io.BufferedReader(json_body, buffer_size=UPLOAD_CHUNK_SIZE),
+                bucket_name,
+                s3_key,
+                ExtraArgs={
+                    'ContentType': 'application/json',
+                    'ContentEncoding': 'gzip',
+                    'ServerSideEncryption': 'AES256'
+                },
+                Config=UPLOAD_TRANSFER_CONFIG
             )
-            status_code = put_response.get('ResponseMetadata', {}).get('HTTPStatusCode')
-            print(f"✅ S3 PUT successful! HTTP Status: {status_code}")
-            print(f"✅ S3 ETag: {put_response.get('ETag', 'N/A')}")
+            print(f"✅ S3 upload successful! Compressed size: {json_body.bytes_read} bytes")
         except Exception as upload_error:
             print(f"❌ S3 PUT FAILED: {upload_error}")
             print(f"❌ Error type: {type(upload_error)}")
@@ -130,34 +167,13 @@ def store_result_in_s3(all_orders: List[Dict[str, Any]], execution_name: str = N
         
         print(f"✅ Stored clean result in S3: s3://{bucket_name}/{s3_key}")
         print(f"🌐 Public URL: {public_url}")
-        print(f"📦 File size: {len(json_body)} bytes")
-        
-        # Verify the file was actually stored
-        try:
-            head_response = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
-            print(f"✅ File verification successful. Size: {head_response.get('ContentLength')} bytes")
-        except Exception as e:
-            print(f"❌ File verification failed: {e}")
         
-        # Also generate presigned URL as backup
-        try:
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket_name, 'Key': s3_key},
-                ExpiresIn=3600 * 24 * 7  # 7 days
-            )
-            print(f"Generated presigned URL: {presigned_url}")
-            return {
-                's3_key': s3_key, 
-                'public_url': public_url,
-                'presigned_url': presigned_url
-            }
-        except Exception as e:
-            print(f"Error generating presigned URL: {e}")
-            return {
-                's3_key': s3_key, 
-                'public_url': public_url
-            }
+        # results/ is public-read through the bucket policy, so the direct URL is enough
+        return {
+            's3_uri': f"s3://{bucket_name}/{s3_key}",
+            's3_key': s3_key, 
+            'public_url': public_url
+        }
         
     except Exception as e:
         print(f"❌ Error storing result in S3: {e}")
@@ -168,12 +184,79 @@ def store_result_in_s3(all_orders: List[Dict[str, Any]], execution_name: str = N
         return None
 
 
+class IterStream(io.RawIOBase):
+    """
+    Read-only file object over an iterator of byte chunks (for upload_fileobj)
+    """
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.pending = b''
+        self.bytes_read = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b''
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        self.bytes_read += size
+        return size
+
+
+def iter_gzip_json_orders(orders: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Yield {"orders": [...]} as gzip-compressed chunks, encoding one order at a time.
+    Each order is written on its own line so clients can also scan the file line by line.
+    """
+    # wbits=31 produces a gzip container; level 1 keeps compression fast
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    buffer = bytearray(b'{"orders":[\n')
+    
+    for index, order in enumerate(orders):
+        if index:
+            buffer += b',\n'
+        buffer += orjson.dumps(order)
+        if len(buffer) >= UPLOAD_CHUNK_SIZE:
+            yield compressor.compress(buffer)
+            buffer.clear()
+    
+    buffer += b'\n]}'
+    yield compressor.compress(buffer)
+    yield compressor.flush()
+
+
+def get_download_executor() -> ThreadPoolExecutor:
+    """
+    Return the download executor, created on first use and kept across warm invocations.
+    Threads are started lazily, so small runs only spawn as many as they need.
+    """
+    global download_executor
+    if download_executor is None:
+        download_executor = ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS, thread_name_prefix='s3dl')
+    return download_executor
+
+
+def get_cleanup_executor() -> ThreadPoolExecutor:
+    """
+    Return the cleanup executor, created on first use and kept across warm invocations
+    """
+    global cleanup_executor
+    if cleanup_executor is None:
+        cleanup_executor = ThreadPoolExecutor(max_workers=MAX_CLEANUP_WORKERS, thread_name_prefix='s3rm')
+    return cleanup_executor
+
+
 def collect_results_from_s3() -> Dict[str, Any]:
     """
     Collect all orders from S3 symbol_results folder with parallel processing
     """
     try:
-        s3_client = boto3.client('s3')
         bucket_name = os.environ.get('RESULTS_BUCKET')
         
         if not bucket_name:
@@ -181,67 +264,93 @@ def collect_results_from_s3() -> Dict[str, Any]:
         
         print(f"Collecting results from s3://{bucket_name}/symbol_results/")
         
-        # List all symbol result files
-        response = s3_client.list_objects_v2(
-            Bucket=bucket_name,
-            Prefix='symbol_results/'
-        )
+        orders_by_id = {}
+        orders_without_id = []
+        total_loaded = 0
+        cleanup_futures = []
+        executor = get_download_executor()
+        deleter = get_cleanup_executor()
         
-        all_orders = []
-        
-        if 'Contents' in response:
-            all_files = [obj['Key'] for obj in response['Contents']]
-            json_files = [obj['Key'] for obj in response['Contents'] if obj['Key'].endswith('.json')]
-            print(f"📁 Found {len(response['Contents'])} total files in symbol_results folder")
-            print(f"📄 Found {len(json_files)} JSON files in symbol_results folder")
-            print(f"📋 All files: {all_files[:10]}...")  # Show first 10 files
-            print(f"📋 JSON files: {json_files[:5]}...")  # Show first 5 JSON files
+        try:
+            # List symbol result files page by page (list_objects_v2 caps each page at 1000 keys)
+            # and submit each page's downloads right away, so they overlap with the listing
+            paginator = s3_client.get_paginator('list_objects_v2')
+            future_to_key = {}
+            total_files = 0
+            for page in paginator.paginate(Bucket=bucket_name, Prefix='symbol_results/'):
+                for obj in page.get('Contents', []):
+                    total_files += 1
+                    if obj['Key'].endswith('.json'):
+                        future_to_key[executor.submit(download_and_parse_file, bucket_name, obj['Key'])] = obj['Key']
             
-            if json_files:
-                # Process files in parallel with optimized thread count
-                max_workers = min(32, len(json_files))  # AWS Lambda max concurrent connections
-                print(f"Processing files with {max_workers} parallel workers")
+            json_files = list(future_to_key.values())
+            if total_files:
+                print(f"📁 Found {total_files} total files in symbol_results folder")
+                print(f"📄 Found {len(json_files)} JSON files in symbol_results folder")
+                print(f"📋 JSON files: {json_files[:5]}...")  # Show first 5 JSON files
                 
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    # Submit all download tasks
-                    future_to_key = {
-                        executor.submit(download_and_parse_file, bucket_name, s3_key): s3_key 
-                        for s3_key in json_files
-                    }
-                    
-                    # Collect results as they complete
-                    for future in as_completed(future_to_key):
-                        s3_key = future_to_key[future]
-                        try:
-                            orders = future.result()
-                            if orders:
-                                all_orders.extend(orders)
-                                print(f"✅ Loaded {len(orders)} orders from {s3_key}")
-                        except Exception as e:
-                            print(f"❌ Error processing {s3_key}: {e}")
-        else:
-            print("No files found in symbol_results folder")
-        
-        # Remove duplicates globally 
-        print(f"Before deduplication: {len(all_orders)} orders")
-        all_orders = remove_global_duplicates(all_orders)
-        print(f"After deduplication: {len(all_orders)} orders")
-        
-        # Sort all orders globally by cTime (newest first)
-        print("Sorting orders globally by cTime...")
-        all_orders.sort(key=safe_ctime_parse, reverse=True)
-        print(f"✅ Orders sorted globally by cTime")
-        
-        # Clean up symbol_results folder after processing
-        if json_files:
-            print(f"🧹 Starting cleanup of {len(json_files)} files AFTER processing")
-            cleanup_symbol_results(bucket_name, json_files)
+                # One pooled connection per worker
+                print(f"Processing files with up to {min(MAX_DOWNLOAD_WORKERS, len(json_files))} parallel workers")
+            else:
+                print("No files found in symbol_results folder")
+            
+            # Files are deleted in background batches as soon as they are parsed, so the
+            # deletes overlap with the remaining downloads and the sort. Files that fail
+            # to parse are kept and reported as failed_files in the response.
+            parsed_files = []
+            failed_files = []
+            
+            # Collect results as they complete
+            for future in as_completed(future_to_key):
+                s3_key = future_to_key[future]
+                try:
+                    file_orders_by_id, file_orders_without_id, file_count = future.result()
+                except Exception as e:
+                    print(f"❌ Error processing {s3_key}: {e}")
+                    failed_files.append(s3_key)
+                    continue
+                
+                if file_count:
+                    # Workers already indexed their orders by orderId, so the
+                    # cross-file deduplication is a single bulk dict merge here
+                    orders_by_id.update(file_orders_by_id)
+                    orders_without_id.extend(file_orders_without_id)
+                    total_loaded += file_count
+                    print(f"✅ Loaded {file_count} orders from {s3_key}")
+                
+                parsed_files.append(s3_key)
+                if len(parsed_files) == DELETE_BATCH_SIZE:
+                    cleanup_futures.append(deleter.submit(cleanup_symbol_results, bucket_name, parsed_files))
+                    parsed_files = []
+            
+            if parsed_files:
+                cleanup_futures.append(deleter.submit(cleanup_symbol_results, bucket_name, parsed_files))
+            
+            duplicates_count = total_loaded - len(orders_by_id) - len(orders_without_id)
+            if duplicates_count > 0:
+                print(f"Removed {duplicates_count} duplicate orders across all symbols")
+            print(f"After deduplication: {total_loaded - duplicates_count} of {total_loaded} orders")
+            
+            # Sort all orders globally by cTime (newest first)
+            print("Sorting orders globally by cTime...")
+            keyed_orders = list(orders_by_id.values())
+            keyed_orders.extend(orders_without_id)
+            keyed_orders.sort(key=itemgetter(0), reverse=True)
+            all_orders = [order for _, order in keyed_orders]
+            print(f"✅ Orders sorted globally by cTime")
+        finally:
+            # Wait for the background cleanup of symbol_results before returning
+            wait(cleanup_futures)
+        
+        if cleanup_futures:
+            print(f"🧹 Cleanup finished in {len(cleanup_futures)} background batches")
         else:
             print("🧹 No files to cleanup")
         
         return {
             'message': 'Orders successfully collected from S3 with parallel processing',
-            'orders': all_orders
+            'orders': all_orders,
+            'failed_files': failed_files
         }
         
     except Exception as e:
@@ -249,26 +358,44 @@ def collect_results_from_s3() -> Dict[str, Any]:
         raise
 
 
-def download_and_parse_file(bucket_name: str, s3_key: str) -> List[Dict[str, Any]]:
+def download_and_parse_file(
+    bucket_name: str, s3_key: str
+) -> Tuple[Dict[str, Tuple[int, Dict[str, Any]]], List[Tuple[int, Dict[str, Any]]], int]:
     """
-    Download and parse a single S3 file (thread-safe)
+    Download and parse a single S3 file (thread-safe). Returns its (cTime, order) pairs
+    indexed by orderId, the pairs without an orderId, and the number of orders read.
+    Errors are raised so the caller can keep failed files out of the cleanup.
     """
-    try:
-        s3_client = boto3.client('s3')
-        file_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-        content = file_response['Body'].read()
-        
-        # Use orjson for ultra-fast parsing
-        try:
-            data = orjson.loads(content)
-        except:
-            # Fallback to standard json
-            data = json.loads(content.decode('utf-8'))
-        
-        return data.get('orders', [])
-    except Exception as e:
-        print(f"Error downloading {s3_key}: {e}")
-        return []
+    file_response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+    content = file_response['Body'].read()
+    if file_response.get('ContentEncoding') == 'gzip':
+        content = gzip.decompress(content)
+    
+    # Use orjson for ultra-fast parsing; a JSONDecodeError propagates so the file is kept.
+    # Every order ends up in keyed_orders anyway, so parsing the whole body at once costs
+    # only the decompressed buffer and is much faster than a streaming parser
+    data = orjson.loads(content)
+    del content
+    orders = data.get('orders', [])
+    
+    # Parse the sort key and index by orderId here so the work overlaps with the other
+    # downloads instead of running on the collecting thread
+    keyed_orders = [(safe_ctime_parse(order), order) for order in orders]
+    
+    # The API already returns orders newest first, so this is close to a linear pass. It hands
+    # the collector one sorted run per file, which the global Timsort merges instead of re-sorting
+    keyed_orders.sort(key=itemgetter(0), reverse=True)
+    
+    orders_by_id = {}
+    orders_without_id = []
+    for entry in keyed_orders:
+        order_id = entry[1].get('orderId')
+        if order_id:
+            orders_by_id[order_id] = entry
+        else:
+            orders_without_id.append(entry)
+    
+    return orders_by_id, orders_without_id, len(keyed_orders)
 
 
 def safe_ctime_parse(order: Dict[str, Any]) -> int:
@@ -276,8 +403,8 @@ def safe_ctime_parse(order: Dict[str, Any]) -> int:
     Safely parse cTime for sorting (optimized)
     """
     try:
-        ctime = order.get('cTime', '0')
-        return int(str(ctime))
+        # int() accepts both the API's string timestamps and ints directly
+        return int(order.get('cTime', 0))
     except (ValueError, TypeError):
         return 0
 
@@ -288,7 +415,6 @@ def cleanup_symbol_results(bucket_name: str, json_files: List[str]) -> None:
     ONLY deletes files from symbol_results/ folder, NOT results/ folder
     """
     try:
-        s3_client = boto3.client('s3')
         
         print(f"🧹 Starting cleanup of symbol_results/ folder only")
         print(f"🧹 Files to delete: {json_files[:5]}...")  # Show first 5 files
@@ -339,33 +465,3 @@ def cleanup_symbol_results(bucket_name: str, json_files: List[str]) -> None:
     except Exception as e:
         print(f"❌ Error during cleanup: {e}")
         # Don't raise - cleanup failure shouldn't stop the main process
-
-
-def remove_global_duplicates(all_orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """
-    Remove duplicate orders across all symbols based on orderId
-    """
-    if not all_orders:
-        return []
-    
-    seen_order_ids = set()
-    unique_orders = []
-    duplicates_count = 0
-    
-    for order in all_orders:
-        order_id = order.get('orderId')
-        if not order_id:
-            # Si no tiene orderId, lo incluimos (caso raro)
-            unique_orders.append(order)
-            continue
-            
-        if order_id not in seen_order_ids:
-            seen_order_ids.add(order_id)
-            unique_orders.append(order)
-        else:
-            duplicates_count += 1
-    
-    if duplicates_count > 0:
-        print(f"Removed {duplicates_count} duplicate orders across all symbols")
-    
-    return unique_orders
\ No newline at end of file
@@ -1,52 +1,157 @@
+import hashlib
+import io
+import itertools
+import json
 import time
 import os
+import zlib
+import random
 import boto3
 import orjson
-from typing import Dict, Any, List
-from pybitget import Client
+import requests
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Iterator, List, Tuple
+from pybitget import Client, exceptions, utils
+from pybitget.enums import API_URL, GET, POST
+
+RESULTS_BUCKET = os.environ.get('RESULTS_BUCKET')
+
+# Empty marker objects for symbols Bitget reports as removed (40309); the symbol unifier
+# drops them from later runs so they cost no API calls (bucket lifecycle expires them)
+REMOVED_SYMBOLS_PREFIX = 'symbol_status/removed/'
+
+# Rate limit backoff (seconds): decorrelated jitter between base and cap so concurrent
+# Map iterations spread their retries instead of re-colliding in lockstep
+RATE_LIMIT_BACKOFF_BASE = 0.5
+RATE_LIMIT_BACKOFF_CAP = 20.0
+
+# Shared S3 client: built once per container and reused across warm invocations
+s3_client = boto3.client(
+    's3',
+    config=Config(
+        retries={'max_attempts': 5, 'mode': 'adaptive'},
+        tcp_keepalive=True
+    )
+)
+
+# Heavy symbols (tens of MB of orders) upload as concurrent 8MB parts instead of one PUT
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=UPLOAD_CHUNK_SIZE,
+    multipart_chunksize=UPLOAD_CHUNK_SIZE,
+    max_concurrency=10
+)
+
+# Shared keep-alive HTTP session for Bitget: pages reuse one TLS connection, and transient
+# 5xx GETs are retried at the transport level with a short backoff (at most a few seconds).
+# A transport retry re-sends the same signed ACCESS-TIMESTAMP, so it must stay well inside
+# Bitget's ~30s timestamp window: Retry-After is ignored and 429 is left to the page retry
+# loop, which signs a fresh request on every attempt
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+))
+
+
+class BitgetClient(Client):
+    """
+    pybitget Client that sends requests through the shared keep-alive session
+    (pybitget itself calls requests.get/post, opening a new connection per request).
+    Mirrors Client._request from python-bitget 1.0.8, pinned in requirements.txt
+    """
+    def _request(self, method, request_path, params, cursor=False):
+        if method == GET:
+            request_path = request_path + utils.parse_params_to_str(params)
+        
+        timestamp = self._get_timestamp() if self.use_server_time else utils.get_timestamp()
+        body = json.dumps(params) if method == POST else ""
+        sign = utils.sign(utils.pre_hash(timestamp, method, request_path, body), self.API_SECRET_KEY)
+        header = utils.get_header(self.API_KEY, sign, timestamp, self.PASSPHRASE)
+        
+        response = http_session.request(method, API_URL + request_path, data=body or None, headers=header)
+        if not str(response.status_code).startswith('2'):
+            raise exceptions.BitgetAPIException(response)
+        
+        # orjson parses the raw bytes directly, skipping requests' encoding sniffing and stdlib json
+        try:
+            if cursor:
+                return orjson.loads(response.content), {
+                    key.lower(): response.headers[key] for key in ('BEFORE', 'AFTER') if key in response.headers
+                }
+            return orjson.loads(response.content)
+        except ValueError:
+            raise exceptions.BitgetRequestException('Invalid Response: %s' % response.text)
+
+# Created on first use by get_bitget_client() and reused across warm invocations
+bitget_client = None
+
+
+def get_bitget_client(api_key: str, secret_key: str, passphrase: str) -> BitgetClient:
+    """
+    Return the container's Bitget client, creating it on the first invocation
+    """
+    global bitget_client
+    if bitget_client is None:
+        bitget_client = BitgetClient(
+            api_key=api_key,
+            api_secret_key=secret_key,
+            passphrase=passphrase
+        )
+    return bitget_client
+
 
 def lambda_handler(event, _):
     """
-    Symbol Processor Lambda: Processes a single symbol to extract all its orders
+    Symbol Processor Lambda: Processes a batch of symbols to extract all their orders
     """
     try:
         print(f"🔄 Symbol Processor started with event: {event}")
         
-        # Extract symbol from event
-        symbol = event.get('symbol')
-        if not symbol:
+        # Extract symbols from event (single 'symbol' kept for direct invocations)
+        symbols = event.get('symbols') or ([event['symbol']] if event.get('symbol') else [])
+        if not symbols:
             print("❌ No symbol provided in event")
             return {}
         
-        print(f"📈 Processing symbol: {symbol}")
+        print(f"📈 Processing {len(symbols)} symbols: {symbols}")
         
         # Initialize Bitget client using environment variables
         api_key = os.environ.get('BITGET_API_KEY')
         secret_key = os.environ.get('BITGET_SECRET_KEY')
         passphrase = os.environ.get('BITGET_PASSPHRASE')
         
-        if not all([api_key, secret_key, passphrase]):
+        if not (api_key and secret_key and passphrase):
             print("❌ Missing Bitget API credentials")
             return {}
         
         print("✅ Bitget credentials found, initializing client")
         
-        client = Client(
-            api_key=api_key,
-            api_secret_key=secret_key,
-            passphrase=passphrase
-        )
+        client = get_bitget_client(api_key, secret_key, passphrase)
         
-        # Extract all orders for this symbol
-        print(f"🔍 Extracting orders for {symbol}")
-        orders = get_all_orders_for_symbol(client, symbol)
-        print(f"📊 Found {len(orders)} orders for {symbol}")
+        # Symbols run one after another: they share the account's history rate limit,
+        # so the batch only saves the per-invocation overhead, not API time.
+        # Their pages go into one body, stored as a single S3 object for the whole batch
+        pages = itertools.chain.from_iterable(iter_orders_for_symbol(client, symbol) for symbol in symbols)
+        json_body, order_count = encode_order_pages(pages)
+        print(f"📊 Found {order_count} orders for {len(symbols)} symbols")
         
         # Store results in S3 if there are any orders
-        if orders:
-            store_orders_in_s3(symbol, orders)
+        if order_count:
+            store_orders_in_s3(symbols, json_body, order_count)
         else:
-            print(f"⚠️ No orders found for {symbol}, not storing in S3")
+            print(f"⚠️ No orders found for {symbols}, not storing in S3")
         
         return {}
         
@@ -55,8 +160,12 @@ def lambda_handler(event, _):
         # CRITICAL: Raise error to fail Lambda completely for Step Function retry
         raise e
 
-def get_all_orders_for_symbol(client: Client, symbol: str) -> List[Dict[str, Any]]:
-    all_orders = []
+def iter_orders_for_symbol(client: Client, symbol: str) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the symbol's order history page by page (newest first)
+    """
+    print(f"🔍 Extracting orders for {symbol}")
+    total_orders = 0
     page_size = 100
     max_pages = 300  # Increased to prevent data loss (30k orders max per symbol)
     
@@ -77,6 +186,7 @@ def get_all_orders_for_symbol(client: Client, symbol: str) -> List[Dict[str, Any
             # Inner retry loop for the same page
             page_success = False
             page_retries = 0
+            backoff_time = RATE_LIMIT_BACKOFF_BASE
             
             while not page_success and page_retries <= max_rate_limit_retries:
                 try:
@@ -107,32 +217,42 @@ def get_all_orders_for_symbol(client: Client, symbol: str) -> List[Dict[str, Any
                     if orders is None:
                         orders = []
                         
-                    all_orders.extend(orders)
+                    total_orders += len(orders)
+                    if orders:
+                        yield orders
                     
                     # DIAGNOSTIC: Log progress for each symbol
-                    print(f"📄 {symbol} page {page_count + 1}: +{len(orders)} orders, total: {len(all_orders)}, next_flag: {next_flag}")
+                    print(f"📄 {symbol} page {page_count + 1}: +{len(orders)} orders, total: {total_orders}, next_flag: {next_flag}")
                     
                     # Mark page as successfully processed
                     page_success = True
 
                     if not next_flag:
-                        print(f"✅ {symbol}: Naturally complete at page {page_count + 1} - {len(all_orders)} total orders")
-                        return all_orders  # Exit completely when done
+                        print(f"✅ {symbol}: Naturally complete at page {page_count + 1} - {total_orders} total orders")
+                        return  # Exit completely when done
                 
                 except Exception as api_error:
-                    error_str = str(api_error).lower()
                     print(f"❌ {symbol} API error on page {page_count + 1}: {api_error}")
                     
+                    # Classify by Bitget's error code / HTTP status instead of sniffing the message
+                    error_code = str(getattr(api_error, 'code', ''))
+                    status_code = getattr(api_error, 'status_code', None)
+                    
                     # Handle discontinued symbols (error code 40309)
-                    if '40309' in error_str or 'symbol has been removed' in error_str or 'removed' in error_str:
-                        print(f"⚠️ {symbol}: Symbol discontinued/removed, skipping with 0 orders")
-                        return []  # Return empty list for discontinued symbols
+                    if error_code == '40309':
+                        print(f"⚠️ {symbol}: Symbol discontinued/removed, skipping remaining pages")
+                        # Only remember it when nothing came back: a symbol that returned orders
+                        # in this run must not be skipped (and its orders lost) in later runs
+                        if page_count == 0 and total_orders == 0:
+                            mark_symbol_removed(symbol)
+                        return  # No more pages for discontinued symbols
                     
                     # Handle rate limiting: wait and retry same page
-                    if '429' in error_str or 'too many requests' in error_str or 'rate limit' in error_str:
+                    if status_code == 429 or error_code == '429':
                         page_retries += 1
                         if page_retries <= max_rate_limit_retries:
-                            backoff_time = 0.5 + (page_retries * 0.3)  # Exponential backoff: 0.8s, 1.1s, 1.4s, etc.
+                            # Decorrelated jitter: random in [base, 3x previous], capped
+                            backoff_time = min(RATE_LIMIT_BACKOFF_CAP, random.uniform(RATE_LIMIT_BACKOFF_BASE, backoff_time * 3))
                             print(f"⏳ {symbol}: Rate limit hit (retry {page_retries}/{max_rate_limit_retries}), backing off {backoff_time:.1f}s...")
                             time.sleep(backoff_time)
                             # Continue inner loop to retry same page
@@ -152,41 +272,74 @@ def get_all_orders_for_symbol(client: Client, symbol: str) -> List[Dict[str, Any
         # CRITICAL: Check if we hit max_pages limit (potential data loss)
         if page_count >= max_pages:
             print(f"🔴 TRUNCATED: {symbol} hit max_pages limit ({max_pages})! POTENTIAL DATA LOSS!")
-            print(f"🔴 Last endId: {last_end_id}, Total orders collected: {len(all_orders)}")
+            print(f"🔴 Last endId: {last_end_id}, Total orders collected: {total_orders}")
             print(f"🔴 This symbol may have more orders that were NOT retrieved")
         else:
-            print(f"📊 {symbol}: Completed pagination, {len(all_orders)} orders in {page_count} pages")
-        
-        # Sort orders by creation time (newest first)
-        #all_orders.sort(key=lambda x: int(x.get('cTime', 0)), reverse=True)
-        return all_orders
+            print(f"📊 {symbol}: Completed pagination, {total_orders} orders in {page_count} pages")
         
     except Exception as general_error:
         print(f"❌ {symbol}: General error - {general_error}")
         # CRITICAL: Raise error to fail Lambda for retry  
         raise general_error
 
-def store_orders_in_s3(symbol: str, orders: List[Dict[str, Any]]):
+def mark_symbol_removed(symbol: str):
     """
-    Store orders in S3 with ultra-fast binary JSON encoding
+    Record that Bitget reported the symbol as removed so the next runs skip it
     """
     try:
-        s3_client = boto3.client('s3')
-        bucket_name = os.environ.get('RESULTS_BUCKET')
-        s3_key = f"symbol_results/{symbol}_{int(time.time())}.json"
+        s3_client.put_object(Bucket=RESULTS_BUCKET, Key=f"{REMOVED_SYMBOLS_PREFIX}{symbol}", Body=b'')
+        print(f"🏷️ {symbol}: Marked as removed")
+    except Exception as e:
+        print(f"⚠️ Could not mark {symbol} as removed: {e}")
+
+def encode_order_pages(pages: Iterator[List[Dict[str, Any]]]) -> Tuple[bytes, int]:
+    """
+    Encode pages into a gzipped {"orders": [...]} body as they arrive, so the full
+    order list is never held in memory next to its serialized copy
+    """
+    # Gzip at level 1: the repeated order keys compress several times over for almost no CPU
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    chunks = [compressor.compress(b'{"orders":[')]
+    order_count = 0
+    
+    for orders in pages:
+        if order_count:
+            chunks.append(compressor.compress(b','))
+        # orjson encodes the page as a JSON array; strip the brackets to splice it into ours
+        chunks.append(compressor.compress(orjson.dumps(orders)[1:-1]))
+        order_count += len(orders)
+    
+    chunks.append(compressor.compress(b']}'))
+    chunks.append(compressor.flush())
+    return b''.join(chunks), order_count
+
+def store_orders_in_s3(symbols: List[str], json_body: bytes, order_count: int):
+    """
+    Store the batch's gzipped orders body in S3 as one object
+    """
+    # Key named after the first symbol, plus how many more the batch holds
+    symbol = symbols[0] if len(symbols) == 1 else f"{symbols[0]}+{len(symbols) - 1}"
+    try:
+        # Short hash shard after symbol_results/ so concurrent PUTs spread across S3 partitions
+        shard = hashlib.blake2b(','.join(symbols).encode(), digest_size=2).hexdigest()
+        s3_key = f"symbol_results/{shard}/{symbol}_{int(time.time())}.json"
         
-        print(f"💾 Storing {len(orders)} orders for symbol {symbol}")
+        print(f"💾 Storing {order_count} orders for symbols {symbols} ({len(json_body)} bytes gzipped)")
         print(f"📁 S3 key: {s3_key}")
         
-        # Use orjson for ultra-fast binary JSON encoding (up to 5x faster)
-        json_body = orjson.dumps({'orders': orders})
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json_body,
-            ContentType='application/json'
+        s3_client.upload_fileobj(
+            io.BytesIO(json_body),
+            RESULTS_BUCKET,
+            s3_key,
+            ExtraArgs={
+                'ContentType': 'application/json',
+                'ContentEncoding': 'gzip',
+                'ServerSideEncryption': 'AES256'
+            },
+            Config=UPLOAD_TRANSFER_CONFIG
         )
         print(f"✅ Successfully stored {symbol} orders in S3")
     except Exception as e:
-        print(f"❌ Error storing {symbol} orders in S3: {e}")
\ No newline at end of file
+        print(f"❌ Error storing {symbol} orders in S3: {e}")
+        # CRITICAL: the whole batch is lost without this object, fail Lambda for Step Function retry
+        raise
\ No newline at end of file
@@ -1,8 +1,9 @@
 import json
 import time
 import os
+import random
 from typing import Dict, Any, List, Set
-from pybitget import Client
+from pybitget import Client, exceptions
 
 SYMBOLS_DISCONTINUED = [
   "10000WHYUSDT_UMCBL",
@@ -31,6 +32,32 @@ SYMBOLS_DISCONTINUED = [
   "TROYUSDT_UMCBL"
 ]
 
+# Backoff ante rate limit (429): exponencial con jitter, de 0.1s hasta 5s, máximo 6 reintentos
+RATE_LIMIT_BACKOFF_BASE = 0.1
+RATE_LIMIT_BACKOFF_CAP = 5.0
+RATE_LIMIT_MAX_RETRIES = 6
+
+# Credenciales Bitget leídas una vez al arrancar el contenedor
+BITGET_API_KEY = os.environ.get('BITGET_API_KEY')
+BITGET_SECRET_KEY = os.environ.get('BITGET_SECRET_KEY')
+BITGET_PASSPHRASE = os.environ.get('BITGET_PASSPHRASE')
+
+# Cliente Bitget creado en la primera invocación y reutilizado mientras el contenedor siga caliente
+bitget_client = None
+
+def get_bitget_client(api_key: str, secret_key: str, passphrase: str) -> Client:
+    """
+    Devuelve el cliente Bitget del contenedor, creándolo en la primera invocación
+    """
+    global bitget_client
+    if bitget_client is None:
+        bitget_client = Client(
+            api_key=api_key,
+            api_secret_key=secret_key,
+            passphrase=passphrase
+        )
+    return bitget_client
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Symbol Searcher Lambda: Busca todos los símbolos con trades en una ventana de tiempo específica
@@ -51,11 +78,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         print(f"Processing window {window_id}: {start_date} to {end_date}")
         
         # Inicializar cliente Bitget
-        api_key = os.environ.get('BITGET_API_KEY')
-        secret_key = os.environ.get('BITGET_SECRET_KEY')
-        passphrase = os.environ.get('BITGET_PASSPHRASE')
-        
-        if not all([api_key, secret_key, passphrase]):
+        if not (BITGET_API_KEY and BITGET_SECRET_KEY and BITGET_PASSPHRASE):
             return {
                 'statusCode': 500,
                 'window_id': window_id,
@@ -63,11 +86,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'symbols': []
             }
         
-        client = Client(
-            api_key=api_key,
-            api_secret_key=secret_key,
-            passphrase=passphrase
-        )
+        client = get_bitget_client(BITGET_API_KEY, BITGET_SECRET_KEY, BITGET_PASSPHRASE)
         
         # Buscar símbolos en esta ventana de tiempo
         symbols = search_symbols_in_window(client, start_time, end_time, window_id)
@@ -176,21 +195,40 @@ def all_symbols(client: Client, start_time: int, end_time: int) -> Set[str]:
     all_symbols = set()
     
     try:
-        response = client.mix_get_symbols_info(productType="umcbl")  # USDT-M futures
+        response = get_symbols_info_with_backoff(client)
         print(f"Fetched products from exchange, {response}")
         products = response.get("data", [])
-        for product in products:
-            symbol = product.get("symbol")
-            if symbol:
-                all_symbols.add(symbol)
+        # Inserción en bloque: el set se construye en C, sin un add() por producto
+        all_symbols = {product["symbol"] for product in products if product.get("symbol")}
         
         # Add discontinued symbols to the set
-        for symbol in SYMBOLS_DISCONTINUED:
-            all_symbols.add(symbol)
+        all_symbols.update(SYMBOLS_DISCONTINUED)
         
         print(f"Total symbols found: {len(all_symbols)} (including {len(SYMBOLS_DISCONTINUED)} discontinued)")
         return all_symbols
         
     except Exception as e:
         print(f"Error fetching all symbols: {e}")
-        return all_symbols  # Retorna lo que haya encontrado hasta ahora
\ No newline at end of file
+        return all_symbols  # Retorna lo que haya encontrado hasta ahora
+
+def get_symbols_info_with_backoff(client: Client) -> Dict[str, Any]:
+    """
+    Consulta los contratos USDT-M reintentando con backoff exponencial + jitter si hay rate limit
+    """
+    backoff = RATE_LIMIT_BACKOFF_BASE
+    attempts = 0
+    
+    while True:
+        try:
+            return client.mix_get_symbols_info(productType="umcbl")  # USDT-M futures
+        except exceptions.BitgetAPIException as api_error:
+            rate_limited = api_error.status_code == 429 or str(api_error.code) == '429'
+            if not rate_limited or attempts >= RATE_LIMIT_MAX_RETRIES:
+                raise
+            
+            # El jitter evita que las ventanas concurrentes reintenten a la vez
+            sleep_time = backoff + random.uniform(0, backoff)
+            attempts += 1
+            print(f"Rate limit hit fetching symbols (retry {attempts}/{RATE_LIMIT_MAX_RETRIES}), backing off {sleep_time:.2f}s...")
+            time.sleep(sleep_time)
+            backoff = min(backoff * 2, RATE_LIMIT_BACKOFF_CAP)
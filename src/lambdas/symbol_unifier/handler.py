@@ -1,10 +1,18 @@
-import json
-import time
 import os
 import boto3
 from typing import Dict, Any, List
 from collections import Counter
 
+s3_client = boto3.client('s3')
+
+# Marcadores que escribe el symbol processor cuando Bitget responde 40309 (símbolo eliminado)
+REMOVED_SYMBOLS_PREFIX = 'symbol_status/removed/'
+
+# Símbolos por invocación del symbol processor: reparte el arranque de cada Lambda entre varios símbolos.
+# Se procesan en serie y un símbolo pesado (300 páginas a ~1 página/s con el rate limit compartido)
+# tarda ~300s, así que 2 por lote caben siempre en el timeout de 900s del processor
+SYMBOL_BATCH_SIZE = int(os.environ.get('SYMBOL_BATCH_SIZE', '2'))
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Symbol Unifier Lambda: Combina todos los símbolos encontrados por las ventanas de tiempo,
@@ -26,10 +34,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         break
         
         if not isinstance(window_results, list):
-            return {'statusCode': 500, 'symbols': []}
+            return {'statusCode': 500, 'symbols': [], 'symbol_batches': []}
         
-        # Combinar todos los símbolos
-        all_symbols = set()
+        # Combinar todos los símbolos: las claves del Counter son los símbolos únicos
         symbol_frequency = Counter()
         
         for result in window_results:
@@ -43,69 +50,55 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     
                     
                     if status_code == 200:
-                        for symbol in symbols:
-                            all_symbols.add(symbol)
-                            symbol_frequency[symbol] += 1
+                        # Conteo en bloque: Counter.update recorre la lista en C
+                        symbol_frequency.update(symbols)
                         
             except Exception:
                 pass
         
+        # Descartar símbolos eliminados en ejecuciones anteriores: no tienen órdenes que consultar
+        removed_symbols = load_removed_symbols() & symbol_frequency.keys()
+        if removed_symbols:
+            for symbol in removed_symbols:
+                del symbol_frequency[symbol]
+            print(f"Skipping {len(removed_symbols)} symbols marked as removed: {sorted(removed_symbols)}")
+        
         # Ordenar símbolos por frecuencia (más activos primero) y luego alfabéticamente
-        #final_symbols = sorted(all_symbols, key=lambda x: (-symbol_frequency[x], x))
+        #final_symbols = sorted(symbol_frequency, key=lambda x: (-symbol_frequency[x], x))
         
-        print(f"Discovered {len(all_symbols)} unique symbols across {len(window_results)} windows, symbols: {all_symbols}")
+        print(f"Discovered {len(symbol_frequency)} unique symbols across {len(window_results)} windows, symbols: {list(symbol_frequency)}")
         
         
-        # Preparar resultado - solo símbolos para optimizar velocidad (convertir set a list)
+        # Preparar resultado - solo símbolos para optimizar velocidad
+        symbols = list(symbol_frequency)
         result = {
             'statusCode': 200,
-            'symbols': list(all_symbols)
+            'symbols': symbols,
+            'symbol_batches': [symbols[i:i + SYMBOL_BATCH_SIZE] for i in range(0, len(symbols), SYMBOL_BATCH_SIZE)]
         }
         
         
         return result
         
     except Exception:
-        return {'statusCode': 500, 'symbols': []}
+        return {'statusCode': 500, 'symbols': [], 'symbol_batches': []}
 
-def save_detailed_stats_to_s3(result: dict, all_symbols: set, symbol_frequency: Counter):
+def load_removed_symbols() -> set:
     """
-    Guarda estadísticas detalladas en S3 para análisis posterior
+    Lee los símbolos marcados como eliminados en symbol_status/removed/
     """
+    bucket_name = os.environ.get('RESULTS_BUCKET')
+    if not bucket_name:
+        return set()
+    
     try:
-        s3_client = boto3.client('s3')
-        bucket_name = os.environ.get('RESULTS_BUCKET')
-        
-        if not bucket_name:
-            print("No RESULTS_BUCKET configured, skipping detailed stats")
-            return
-        
-        timestamp = int(time.time())
-        s3_key = f"symbol_discovery_stats/{timestamp}_symbol_stats.json"
-        
-        detailed_stats = {
-            'timestamp': timestamp,
-            'summary': result,
-            'all_symbols': sorted(list(all_symbols)),
-            'symbol_frequency': dict(symbol_frequency),
-            'discovery_metadata': {
-                'total_symbols_discovered': len(all_symbols),
-                'most_frequent_symbol': symbol_frequency.most_common(1)[0] if symbol_frequency else None,
-                'symbols_appearing_once': sum(1 for count in symbol_frequency.values() if count == 1),
-                'symbols_appearing_multiple_times': sum(1 for count in symbol_frequency.values() if count > 1)
-            }
-        }
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json.dumps(detailed_stats, indent=2, ensure_ascii=False),
-            ContentType='application/json',
-            ServerSideEncryption='AES256'
-        )
-        
-        print(f"Detailed stats saved to s3://{bucket_name}/{s3_key}")
-        
+        removed_symbols = set()
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=REMOVED_SYMBOLS_PREFIX):
+            for obj in page.get('Contents', []):
+                removed_symbols.add(obj['Key'][len(REMOVED_SYMBOLS_PREFIX):])
+        return removed_symbols
     except Exception as e:
-        print(f"Error saving detailed stats to S3: {e}")
-        # No re-lanzar la excepción para no fallar el proceso principal
\ No newline at end of file
+        # Sin la lista se procesan todos los símbolos, como antes
+        print(f"Error loading removed symbols: {e}")
+        return set()
@@ -15,6 +15,10 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         end_time = int(time.time() * 1000)  # Ahora en milisegundos
         start_time = end_time - (7 * 365 * 24 * 60 * 60 * 1000)  # 8 años atrás
         
+        # Fechas legibles calculadas una sola vez: se usan en la ventana y en el log
+        start_date = datetime.fromtimestamp(start_time / 1000).isoformat()
+        end_date = datetime.fromtimestamp(end_time / 1000).isoformat()
+        
         # Generar ventanas de tiempo
         time_windows = []
         window_id = 1
@@ -24,8 +28,8 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
             "window_id": window_id,
             "start_time": start_time,      
             "end_time": end_time,
-            "start_date": datetime.fromtimestamp(start_time / 1000).isoformat(),
-            "end_date": datetime.fromtimestamp(end_time / 1000).isoformat(),
+            "start_date": start_date,
+            "end_date": end_date,
             "duration_days": (end_time - start_time) / (24 * 60 * 60 * 1000)
         }
         time_windows.append(window)
@@ -48,7 +52,7 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         #     window_id += 1
         
         print(f"Generated {len(time_windows)} time windows of ~6 months each")
-        print(f"Time range: {datetime.fromtimestamp(start_time / 1000).isoformat()} to {datetime.fromtimestamp(end_time / 1000).isoformat()}")
+        print(f"Time range: {start_date} to {end_date}")
         
         # Resultado para el Step Function
         result = {
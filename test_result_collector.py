@@ -4,28 +4,17 @@ Test script para ejecutar el Result Collector directamente
 """
 import boto3
 import json
+import os
+
+# Nombre de la función en template_complete.yaml; invoke acepta el nombre directamente
+RESULT_COLLECTOR_FUNCTION = os.environ.get('RESULT_COLLECTOR_FUNCTION', 'bitget-result-collector')
 
 def test_result_collector():
     """Test directo del Result Collector"""
     
-    # Obtener ARN de la función
     lambda_client = boto3.client('lambda')
     
     try:
-        # Buscar la función Result Collector
-        functions = lambda_client.list_functions()
-        result_collector_arn = None
-        
-        for func in functions['Functions']:
-            if 'result-collector' in func['FunctionName'].lower():
-                result_collector_arn = func['FunctionArn']
-                print(f"✅ Found Result Collector: {func['FunctionName']}")
-                break
-        
-        if not result_collector_arn:
-            print("❌ Result Collector function not found")
-            return
-        
         # Payload de test
         test_payload = {
             "execution_name": f"test-direct-{int(__import__('time').time())}",
@@ -34,18 +23,18 @@ def test_result_collector():
             "test_mode": True
         }
         
-        print(f"🚀 Invoking Result Collector directly...")
+        print(f"🚀 Invoking Result Collector directly: {RESULT_COLLECTOR_FUNCTION}")
         print(f"📋 Payload: {json.dumps(test_payload, indent=2)}")
         
         # Invocar la función directamente
         response = lambda_client.invoke(
-            FunctionName=result_collector_arn,
+            FunctionName=RESULT_COLLECTOR_FUNCTION,
             InvocationType='RequestResponse',
             Payload=json.dumps(test_payload)
         )
         
         # Leer la respuesta
-        result = json.loads(response['Payload'].read().decode('utf-8'))
+        result = json.loads(response['Payload'].read())
         
         print(f"✅ Result Collector Response:")
         print(json.dumps(result, indent=2))